@@ -5,6 +5,7 @@ import psycopg2
 from psycopg2.extras import DictCursor
 import os
 import logging
+import uuid
 from google import genai
 from dotenv import load_dotenv
 
@@ -135,91 +136,84 @@ class Database:
             logger.error(f"最近のメッセージ取得エラー: {e}")
             return []
     
-    def find_similar_conversations(
+    @staticmethod
+    def format_similar_context(messages: List[Dict[str, Any]], display_name: str) -> str:
+        """類似メッセージをプロンプト用の文字列に整形"""
+        if not messages:
+            return ""
+
+        context_parts = []
+
+        same_user_messages = [m for m in messages if m['display_name'] == display_name]
+        other_user_messages = [m for m in messages if m['display_name'] != display_name]
+
+        if same_user_messages:
+            context_parts.append("\n以前の関連する会話:")
+            for msg in same_user_messages:
+                context_parts.append(
+                    f"{msg['display_name']}さん: {msg['content']}"
+                )
+
+        if other_user_messages:
+            context_parts.append("\n他のお客様との関連する会話:")
+            for msg in other_user_messages:
+                context_parts.append(
+                    f"{msg['display_name']}さん: {msg['content']}"
+                )
+
+        return "\n".join(context_parts)
+
+    def find_similar_messages(
         self,
-        content: str,
-        display_name: str,
+        message_id: str,
         similarity_threshold: float = 0.8,
         max_results: int = 3
-    ) -> str:
+    ) -> List[Dict[str, Any]]:
+        """保存済みエンベディングを使って類似メッセージを検索（表示名ごとに上位max_results件）"""
         try:
-            if not self.genai_client:
-                return ""
-
-            # 入力テキストのエンベディングを生成
-            response = self.genai_client.models.embed_content(
-                model="text-embedding-004",
-                contents=content
-            )
-            
-            if not response or not response.embeddings:
-                logger.error("No embedding generated")
-                return ""
-                
-            query_embedding = response.embeddings[0].values
-
             with self.get_connection() as conn:
                 with conn.cursor(cursor_factory=DictCursor) as cur:
                     # インデックスを使用した効率的な検索
-                    # 直前のメッセージを除外するために created_at で時間的な制限を追加
                     cur.execute("""
-                        WITH SimilarMessages AS (
-                            SELECT 
+                        WITH source AS (
+                            SELECT id, embedding FROM tech_bar_messages
+                            WHERE id = %s AND embedding IS NOT NULL
+                        ),
+                        SimilarMessages AS (
+                            SELECT
+                                m.id,
                                 m.content,
                                 m.metadata->>'display_name' as display_name,
-                                1 - (m.embedding <=> %s::vector) as similarity,
+                                1 - (m.embedding <=> source.embedding) as similarity,
                                 ROW_NUMBER() OVER (
                                     PARTITION BY m.metadata->>'display_name'
-                                    ORDER BY 1 - (m.embedding <=> %s::vector) DESC
+                                    ORDER BY 1 - (m.embedding <=> source.embedding) DESC
                                 ) as rank
-                            FROM tech_bar_messages m
+                            FROM tech_bar_messages m, source
                             WHERE m.embedding IS NOT NULL
-                            AND 1 - (m.embedding <=> %s::vector) > %s
-                            AND m.created_at < (NOW() - INTERVAL '5 seconds')  -- 直前のメッセージを除外
+                            AND m.id <> source.id
+                            AND 1 - (m.embedding <=> source.embedding) > %s
                         )
-                        SELECT *
+                        SELECT id, content, display_name, similarity
                         FROM SimilarMessages
                         WHERE rank <= %s
                         ORDER BY similarity DESC
-                    """, (
-                        query_embedding,
-                        query_embedding,
-                        query_embedding,
-                        similarity_threshold,
-                        max_results
-                    ))
+                    """, (message_id, similarity_threshold, max_results))
 
-                    results = cur.fetchall()
-                    
-                    if not results:
-                        return ""
-
-                    context_parts = []
-                    
-                    # 結果を整形
-                    same_user_messages = [r for r in results if r['display_name'] == display_name]
-                    other_user_messages = [r for r in results if r['display_name'] != display_name]
-
-                    if same_user_messages:
-                        context_parts.append("\n以前の関連する会話:")
-                        for msg in same_user_messages:
-                            context_parts.append(
-                                f"{msg['display_name']}さん: {msg['content']}"
-                            )
-
-                    if other_user_messages:
-                        context_parts.append("\n他のお客様との関連する会話:")
-                        for msg in other_user_messages:
-                            context_parts.append(
-                                f"{msg['display_name']}さん: {msg['content']}"
-                            )
-
-                    return "\n".join(context_parts)
+                    return [
+                        {
+                            "id": str(row["id"]),
+                            "content": row["content"],
+                            "display_name": row["display_name"],
+                            "similarity": row["similarity"]
+                        }
+                        for row in cur.fetchall()
+                    ]
 
         except Exception as e:
-            logger.error(f"類似会話検索エラー: {e}")
-            return ""
-        
+            logger.error(f"類似メッセージ検索エラー: {e}")
+            return []
+
     def get_or_create_conversation(self, session_id: str) -> Optional[str]:
         """セッションIDに対応する会話を取得または作成"""
         try:
@@ -312,4 +306,74 @@ class Database:
                     
         except Exception as e:
             logger.error(f"メッセージ保存エラー: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    @staticmethod
+    def _advisory_lock_key(message_id: str) -> int:
+        """メッセージIDからpg_advisory_xact_lock用の64bitキーを生成"""
+        return int.from_bytes(uuid.UUID(message_id).bytes[:8], "big", signed=True)
+
+    def index_related_messages(
+        self,
+        message_id: str,
+        neighbors: List[Dict[str, Any]],
+        max_results: int = 3
+    ) -> bool:
+        """find_similar_messagesの結果をtech_bar_related_messagesに保存し、関連先のリストも更新"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    neighbor_ids = sorted(n['id'] for n in neighbors)
+
+                    # 関連リストを更新するメッセージ単位でロック（キー順に取得してデッドロックを防ぐ）
+                    lock_keys = sorted({
+                        self._advisory_lock_key(mid)
+                        for mid in neighbor_ids + [message_id]
+                    })
+                    for lock_key in lock_keys:
+                        cur.execute("SELECT pg_advisory_xact_lock(%s)", (lock_key,))
+
+                    # 新しいメッセージの関連リストを置き換え
+                    cur.execute("""
+                        DELETE FROM tech_bar_related_messages
+                        WHERE source_message_id = %s
+                    """, (message_id,))
+
+                    if neighbors:
+                        psycopg2.extras.execute_values(cur, """
+                            INSERT INTO tech_bar_related_messages
+                            (source_message_id, related_message_id, similarity_score)
+                            VALUES %s
+                            ON CONFLICT (source_message_id, related_message_id)
+                            DO UPDATE SET similarity_score = EXCLUDED.similarity_score
+                        """, sorted([
+                            (message_id, n['id'], n['similarity'])
+                            for n in neighbors
+                        ] + [
+                            (n['id'], message_id, n['similarity'])
+                            for n in neighbors
+                        ]))
+
+                        # 関連先のリストを表示名ごとに上位max_results件に切り詰め
+                        cur.execute("""
+                            DELETE FROM tech_bar_related_messages r
+                            USING (
+                                SELECT
+                                    rm.id,
+                                    ROW_NUMBER() OVER (
+                                        PARTITION BY rm.source_message_id, m.metadata->>'display_name'
+                                        ORDER BY rm.similarity_score DESC
+                                    ) as rank
+                                FROM tech_bar_related_messages rm
+                                JOIN tech_bar_messages m ON m.id = rm.related_message_id
+                                WHERE rm.source_message_id = ANY(%s::uuid[])
+                            ) ranked
+                            WHERE r.id = ranked.id AND ranked.rank > %s
+                        """, (neighbor_ids, max_results))
+
+                    conn.commit()
+                    return True
+
+        except Exception as e:
+            logger.error(f"関連メッセージのインデックス作成エラー: {e}")
+            return False
@@ -1,11 +1,9 @@
 # backend/src/functions/main.py
 from fastapi import FastAPI, WebSocket, HTTPException, Request  
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 from pydantic import BaseModel, Field
 import asyncio
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 from datetime import datetime, timedelta
 import uuid
 from google import genai
@@ -14,6 +12,7 @@ from dotenv import load_dotenv
 import logging
 import json
 from database import Database
+from static_assets import StaticAssetStore
 from pathlib import Path
 
 # ロギングの設定
@@ -34,10 +33,8 @@ BASE_DIR = Path("/workspace")  # Dockerコンテナ内の作業ディレクト
 FRONTEND_DIR = BASE_DIR / "frontend" / "dist"
 logger.info(f"FRONTEND_DIR: {FRONTEND_DIR}")
 
-# 静的ファイルのマウント（本番ビルド環境用）
-if FRONTEND_DIR.exists():
-    app.mount("/css", StaticFiles(directory=str(FRONTEND_DIR / "css")), name="css")
-    app.mount("/js", StaticFiles(directory=str(FRONTEND_DIR / "js")), name="js")
+# 静的ファイルを起動時にメモリへ読み込み、圧縮済みで配信（本番ビルド環境用）
+static_assets = StaticAssetStore(FRONTEND_DIR) if FRONTEND_DIR.exists() else None
 
 # Pydanticモデル
 class Message(BaseModel):
@@ -71,14 +68,22 @@ class UserEnterRequest(BaseModel):
         }
 
 # 静的ファイルの提供（本番ビルド環境用）
-if FRONTEND_DIR.exists():
-    @app.get("/favicon.ico")
-    async def favicon():
-        return FileResponse(str(FRONTEND_DIR / "favicon.ico"))
+if static_assets:
+    @app.api_route("/favicon.ico", methods=["GET", "HEAD"])
+    async def favicon(request: Request):
+        return static_assets.response("favicon.ico", request)
 
-    @app.get("/")
-    async def read_root():
-        return FileResponse(str(FRONTEND_DIR / "index.html"))
+    @app.api_route("/", methods=["GET", "HEAD"])
+    async def read_root(request: Request):
+        return static_assets.response("index.html", request)
+
+    @app.api_route("/css/{file_path:path}", methods=["GET", "HEAD"])
+    async def css_files(file_path: str, request: Request):
+        return static_assets.response(f"css/{file_path}", request)
+
+    @app.api_route("/js/{file_path:path}", methods=["GET", "HEAD"])
+    async def js_files(file_path: str, request: Request):
+        return static_assets.response(f"js/{file_path}", request)
 
 # CORSミドルウェアの設定
 app.add_middleware(
@@ -103,6 +108,22 @@ except Exception as e:
 # WebSocket接続を管理する辞書
 connected_users: Dict[str, WebSocket] = {}
 
+# 実行中のバックグラウンドタスク（GCで破棄されないよう参照を保持）
+background_tasks: Set[asyncio.Task] = set()
+
+# 関連メッセージのインデックス作成の同時実行数（スレッドプールとDB接続を占有しないよう制限）
+related_indexing_semaphore = asyncio.Semaphore(2)
+
+async def run_related_message_indexing(message_id: str, neighbors: List[Dict[str, Any]]):
+    async with related_indexing_semaphore:
+        await asyncio.to_thread(pg_db.index_related_messages, message_id, neighbors)
+
+def schedule_related_message_indexing(message_id: str, neighbors: List[Dict[str, Any]]):
+    """返信時に検索した類似メッセージをバックグラウンドで保存"""
+    task = asyncio.create_task(run_related_message_indexing(message_id, neighbors))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
 def format_timestamp(dt: datetime) -> str:
     """タイムスタンプをISO 8601形式でZ付きに統一"""
     return dt.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
@@ -278,13 +299,23 @@ async def send_message(message: Message):
 
         # Gemini APIを使用して応答を生成
         if message.type == 'user' and genai_client:
+            current_users = [user['display_name'] for user in pg_db.get_active_users()]
+            recent_messages = pg_db.get_recent_messages(limit=5)
+
+            # 保存済みエンベディングで類似メッセージを検索し、結果の保存はバックグラウンドで行う
+            similar_messages = []
+            if user_msg_id:
+                similar_messages = pg_db.find_similar_messages(user_msg_id)
+                schedule_related_message_indexing(user_msg_id, similar_messages)
+            similar_context = pg_db.format_similar_context(
+                similar_messages,
+                message.display_name
+            )
+
             context = {
-                'current_users': [user['display_name'] for user in pg_db.get_active_users()],
-                'recent_messages': pg_db.get_recent_messages(limit=5),
-                'similar_context': pg_db.find_similar_conversations(
-                    message.content,
-                    message.display_name
-                )
+                'current_users': current_users,
+                'recent_messages': recent_messages,
+                'similar_context': similar_context
             }
             
             prompt = construct_prompt(message.content, message.display_name, context)
@@ -0,0 +1,181 @@
+# backend/src/functions/static_assets.py
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotliが無い環境ではgzipのみ配信
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Vue CLIのビルド成果物に付与されるコンテンツハッシュ (例: app.1a2b3c4d.js)
+HASHED_FILENAME_PATTERN = re.compile(r"\.[0-9a-f]{8,}\.")
+
+# 圧縮しても効果の薄いファイル形式
+INCOMPRESSIBLE_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".woff", ".woff2"}
+
+# ルーティングしているファイル・ディレクトリのみ読み込む
+SERVED_FILES = ("index.html", "favicon.ico")
+SERVED_DIRS = ("css", "js")
+
+# 起動時に圧縮するため、コールドスタートを遅らせない程度の品質に抑える
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+@dataclass
+class StaticAsset:
+    """メモリ上に保持する静的ファイルとその圧縮済みバリアント"""
+    content_type: str
+    cache_control: str
+    etag: str
+    # エンコーディング名 ("identity" / "br" / "gzip") -> 本文
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+
+class StaticAssetStore:
+    """フロントエンドのビルド成果物を起動時に読み込み、圧縮済みで配信する"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.assets: Dict[str, StaticAsset] = {}
+        self._load()
+
+    def _iter_served_files(self):
+        for name in SERVED_FILES:
+            path = self.root / name
+            if path.is_file():
+                yield path
+        for dir_name in SERVED_DIRS:
+            for path in sorted((self.root / dir_name).rglob("*")):
+                # ソースマップは配信しない
+                if path.is_file() and path.suffix != ".map":
+                    yield path
+
+    def _load(self):
+        for path in self._iter_served_files():
+            rel_path = path.relative_to(self.root).as_posix()
+            self.assets[rel_path] = self._build_asset(path)
+        logger.info(f"Loaded {len(self.assets)} static assets from {self.root}")
+
+    def _build_asset(self, path: Path) -> StaticAsset:
+        body = path.read_bytes()
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "image/svg+xml"):
+            content_type += "; charset=utf-8"
+
+        if HASHED_FILENAME_PATTERN.search(path.name):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = REVALIDATE_CACHE_CONTROL
+
+        asset = StaticAsset(
+            content_type=content_type,
+            cache_control=cache_control,
+            etag=hashlib.sha256(body).hexdigest()[:32],
+            variants={"identity": body}
+        )
+
+        if path.suffix.lower() not in INCOMPRESSIBLE_SUFFIXES:
+            # 元のサイズより小さくなる場合のみ圧縮版を保持
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+                if len(compressed) < len(body):
+                    asset.variants["br"] = compressed
+            compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            if len(compressed) < len(body):
+                asset.variants["gzip"] = compressed
+
+        return asset
+
+    def get(self, rel_path: str) -> Optional[StaticAsset]:
+        return self.assets.get(rel_path)
+
+    @staticmethod
+    def _accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+        """Accept-Encodingヘッダーをエンコーディング名 -> q値に変換"""
+        encodings = {}
+        for part in accept_encoding.split(","):
+            token, _, params = part.strip().partition(";")
+            token = token.strip().lower()
+            if not token:
+                continue
+            q = 1.0
+            for param in params.split(";"):
+                name, _, value = param.strip().partition("=")
+                if name.strip().lower() == "q":
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0.0
+            encodings[token] = q
+        return encodings
+
+    def _select_encoding(self, asset: StaticAsset, accept_encoding: str) -> str:
+        accepted = self._accepted_encodings(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        best, best_q = "identity", 0.0
+        # 同じq値ならbrを優先
+        for encoding in ("br", "gzip"):
+            if encoding not in asset.variants:
+                continue
+            q = accepted.get(encoding, wildcard)
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    @staticmethod
+    def _etag_matches(if_none_match: str, etag: str) -> bool:
+        if if_none_match.strip() == "*":
+            return True
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate.startswith("W/"):
+                candidate = candidate[2:]
+            if candidate == etag:
+                return True
+        return False
+
+    def response(self, rel_path: str, request: Request) -> Response:
+        asset = self.get(rel_path)
+        if asset is None:
+            return Response(status_code=404)
+
+        encoding = self._select_encoding(asset, request.headers.get("accept-encoding", ""))
+        # 表現ごとに異なる強いETagを付与
+        etag = f'"{asset.etag}"' if encoding == "identity" else f'"{asset.etag}-{encoding}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and self._etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        body = asset.variants[encoding]
+        if request.method == "HEAD":
+            # HEADではヘッダーのみ返す
+            headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(
+            content=body,
+            media_type=asset.content_type,
+            headers=headers
+        )